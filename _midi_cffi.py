@@ -0,0 +1,116 @@
+"""Binding module for liblinkbridge.so.
+
+Prefers a cffi ABI-mode binding (no libffi marshalling on each call, so the
+per-tick FFI cost in the hot loop is much lower than ctypes) and falls back
+to the original ctypes binding when cffi is not installed, so clock.py and
+debugAutomaticClock.py keep working either way.
+"""
+
+import os
+
+try:
+    from cffi import FFI
+    _HAVE_CFFI = True
+except ImportError:
+    import ctypes
+    _HAVE_CFFI = False
+
+# Resolve all symbols eagerly at dlopen time (RTLD_NOW) so no lazy PLT
+# binding can stall the first midi_send_clock; RTLD_DEEPBIND keeps our
+# symbols from being shadowed by anything the process already loaded
+_DLOPEN_FLAGS = os.RTLD_NOW | getattr(os, "RTLD_DEEPBIND", 0)
+
+# Declarations for the exported C API (keep in sync with midi_clock_lib.c)
+_CDEF = """
+int midi_init(void);
+int midi_enable_realtime(int prio);
+int midi_pin_cpu(int cpu);
+int midi_set_tempo(int bpm10);
+int *midi_tempo_ptr(void);
+int midi_send_start(void);
+int midi_send_clock(void);
+int midi_schedule_clock(unsigned int n);
+int midi_flush(void);
+int midi_sleep_until_monotonic_ns(uint64_t deadline_ns);
+int midi_timerfd_setup(uint64_t interval_ns, uint64_t first_deadline_ns);
+uint64_t midi_timerfd_wait(void);
+int midi_run_clock(int *stop_flag);
+int midi_start_generator(void);
+int midi_stop_generator(void);
+int midi_send_stop(void);
+unsigned int midi_get_tick_count(void);
+unsigned int *midi_get_tick_count_ptr(void);
+int midi_get_client_id(void);
+int midi_get_port_id(void);
+int midi_get_queue_id(void);
+void midi_cleanup(void);
+"""
+
+
+# cffi instance used for the loaded library (set by _load_cffi)
+_ffi = None
+
+
+def _load_cffi(lib_path):
+    global _ffi
+    _ffi = FFI()
+    _ffi.cdef(_CDEF)
+    return _ffi.dlopen(lib_path, _DLOPEN_FLAGS)
+
+
+def _load_ctypes(lib_path):
+    lib = ctypes.CDLL(lib_path, mode=_DLOPEN_FLAGS)
+
+    # Define function prototypes
+    lib.midi_init.restype = ctypes.c_int
+    lib.midi_enable_realtime.restype = ctypes.c_int
+    lib.midi_enable_realtime.argtypes = [ctypes.c_int]
+    lib.midi_pin_cpu.restype = ctypes.c_int
+    lib.midi_pin_cpu.argtypes = [ctypes.c_int]
+    lib.midi_send_start.restype = ctypes.c_int
+    lib.midi_send_clock.restype = ctypes.c_int
+    lib.midi_schedule_clock.restype = ctypes.c_int
+    lib.midi_schedule_clock.argtypes = [ctypes.c_uint]
+    lib.midi_flush.restype = ctypes.c_int
+    lib.midi_sleep_until_monotonic_ns.restype = ctypes.c_int
+    lib.midi_sleep_until_monotonic_ns.argtypes = [ctypes.c_uint64]
+    lib.midi_timerfd_setup.restype = ctypes.c_int
+    lib.midi_timerfd_setup.argtypes = [ctypes.c_uint64, ctypes.c_uint64]
+    lib.midi_timerfd_wait.restype = ctypes.c_uint64
+    lib.midi_run_clock.restype = ctypes.c_int
+    lib.midi_run_clock.argtypes = [ctypes.POINTER(ctypes.c_int)]
+    lib.midi_start_generator.restype = ctypes.c_int
+    lib.midi_stop_generator.restype = ctypes.c_int
+    lib.midi_send_stop.restype = ctypes.c_int
+    lib.midi_get_tick_count.restype = ctypes.c_uint
+    lib.midi_get_tick_count_ptr.restype = ctypes.POINTER(ctypes.c_uint)
+    lib.midi_get_client_id.restype = ctypes.c_int
+    lib.midi_get_port_id.restype = ctypes.c_int
+    lib.midi_get_queue_id.restype = ctypes.c_int
+    lib.midi_cleanup.restype = None
+    lib.midi_set_tempo.restype = ctypes.c_int
+    lib.midi_set_tempo.argtypes = [ctypes.c_int]
+    lib.midi_tempo_ptr.restype = ctypes.POINTER(ctypes.c_int)
+
+    return lib
+
+
+def load_midi_lib(lib_path):
+    """Load the MIDI clock library and return a handle with the C functions
+    as attributes (call surface is the same for both backends).
+
+    Raises OSError if the library cannot be loaded.
+    """
+    if _HAVE_CFFI:
+        return _load_cffi(lib_path)
+    return _load_ctypes(lib_path)
+
+
+def new_int_p(value=0):
+    """Allocate an int usable as a C `int *` argument (e.g. the stop flag
+    for midi_run_clock). Read/write it with `p[0]`. With the cffi backend
+    the library must already be loaded.
+    """
+    if _HAVE_CFFI:
+        return _ffi.new("int *", value)
+    return ctypes.pointer(ctypes.c_int(value))
@@ -0,0 +1,384 @@
+"""Shared core for the LinkBridge MIDI clock scripts.
+
+clock.py and debugAutomaticClock.py used to carry nearly identical 100+ line
+main() bodies, so every timing optimization had to be applied twice and the
+copies drifted (the debug script was still passing whole BPM values where the
+library had moved to tenths). run() is now the single code path: clock.py
+runs the C-paced clock thread with a Link tempo monitor, while the debug
+script runs the Python-paced batch loop with a scripted tempo sequence.
+"""
+
+import gc
+import os
+import signal
+import time
+import threading
+from collections import deque
+
+from _midi_cffi import load_midi_lib
+
+# Constants
+PPQN = 24  # Pulses Per Quarter Note
+QUEUE_PPQ = 96  # ALSA queue resolution used by midi_clock_lib.c (4 queue ticks per MIDI clock)
+TICKS_PER_BATCH = PPQN // 2  # MIDI clocks pre-enqueued per FFI call (~250 ms at 120 BPM)
+RT_PRIORITY = 50  # SCHED_FIFO priority requested for the tick path
+# CPU to pin the tick path to (-1 = no pinning); pairs with isolcpus= and
+# the performance governor on that core, see README
+PIN_CPU = int(os.environ.get("LINKBRIDGE_PIN_CPU", "-1"))
+
+# Global state
+running = True
+midi_lib = None
+tempo_ptr = None  # direct pointer into the C library's atomic tempo word
+tick_interval_ns = None
+current_bpm = 120.0
+_pace_in_python = False
+
+
+def calculate_tick_interval_ns(bpm):
+    """Calculate the interval between MIDI clock ticks in integer nanoseconds
+    for given BPM (exact arithmetic on tenths, no float rounding drift)"""
+    bpm10 = int(round(float(bpm) * 10.0))
+    return 600_000_000_000 // (bpm10 * PPQN)
+
+
+def change_tempo(new_bpm):
+    """Change the tempo of the MIDI clock (applies to the C library).
+
+    With the C-paced clock the new tempo is stored lock-free into the
+    library's atomic tempo word and the tick thread applies the queue-tempo
+    change itself; with the Python-paced loop (nothing reads the atomic)
+    the change goes through midi_set_tempo instead.
+    """
+    global current_bpm, tick_interval_ns
+    # new_bpm can be fractional (float). We send tempo to C in tenths (int)
+    bpm10 = int(round(float(new_bpm) * 10.0))
+    if tempo_ptr is None:
+        # library not ready yet — just update local tempo so run() picks it up
+        current_bpm = float(new_bpm)
+        tick_interval_ns = calculate_tick_interval_ns(current_bpm)
+        print(f"[Python] Tempo updated locally -> {current_bpm:.1f} BPM (C lib not ready)")
+        return
+
+    if _pace_in_python:
+        if midi_lib.midi_set_tempo(bpm10) < 0:
+            print(f"[Python] Warning: Failed to set tempo to {float(new_bpm):.1f} BPM in C library")
+            return
+    else:
+        # Lock-free handoff to the C tick thread
+        tempo_ptr[0] = bpm10
+
+    current_bpm = float(new_bpm)
+    tick_interval_ns = calculate_tick_interval_ns(current_bpm)
+    print(f"[Python] Tempo changed -> {current_bpm:.1f} BPM")
+
+
+def signal_handler(sig, frame):
+    """Handle SIGINT (Ctrl+C) for clean shutdown"""
+    global running
+    print("\n[Python] Received SIGINT, shutting down...")
+    running = False
+
+
+def _run_c_loop(bpm_sequence=None, change_interval_s=None):
+    """Run the tick data plane on a C-owned generator thread; Python is a
+    pure control plane (status, scripted tempo, lifetime).
+    Returns (tick_count, beat_count)."""
+    if midi_lib.midi_start_generator() < 0:
+        print("[Python] Error: Failed to start clock generator thread")
+        return -1, -1
+
+    beat_count = 0
+    seq_index = 0
+    next_change = time.monotonic() + change_interval_s if bpm_sequence else None
+
+    # Poll the queue tick through a direct pointer read - no FFI call
+    tick_ptr = midi_lib.midi_get_tick_count_ptr()
+    _sleep = time.sleep
+    # One syscall per status line, no io-lock/buffer management like print
+    write = os.write
+    last_tick = tick_ptr[0]
+    stalled_polls = 0
+
+    try:
+        while running:
+            _sleep(0.5)
+
+            # Liveness check: the generator should keep the queue tick
+            # moving (several seconds of slack covers very slow tempos)
+            if tick_ptr[0] == last_tick:
+                stalled_polls += 1
+                if stalled_polls >= 10:
+                    print("[Python] Error: clock generator stalled")
+                    break
+            else:
+                last_tick = tick_ptr[0]
+                stalled_polls = 0
+
+            # Apply scripted tempo changes, if any
+            if next_change is not None and time.monotonic() >= next_change:
+                change_tempo(bpm_sequence[seq_index])
+                seq_index = (seq_index + 1) % len(bpm_sequence)
+                next_change += change_interval_s
+
+            # Print status once per quarter note boundary crossed
+            queue_tick = tick_ptr[0]
+            beats = queue_tick // QUEUE_PPQ
+            if beats != beat_count:
+                beat_count = beats
+                write(1, f"[Python] Beat {beat_count:4d} | MIDI Tick {queue_tick // (QUEUE_PPQ // PPQN):6d} | Queue Tick {queue_tick:6d}\n".encode())
+
+    except Exception as e:
+        print(f"[Python] Error in main loop: {e}")
+
+    # Stop the generator thread and wait for its current batch
+    midi_lib.midi_stop_generator()
+    tick_count = tick_ptr[0] // (QUEUE_PPQ // PPQN)
+    return tick_count, beat_count
+
+
+def _run_python_loop(bpm_sequence=None, change_interval_s=None):
+    """Top up the ALSA queue with scheduled tick batches from Python, paced
+    by a kernel timerfd. Returns (tick_count, beat_count)."""
+    global running
+
+    # Status output happens off the tick path: the loop only appends a tuple
+    # of ints, a daemon thread does the formatting, queue-tick poll and print
+    log_q = deque(maxlen=256)
+
+    def log_worker():
+        # read the queue tick through a direct pointer - no FFI call per poll
+        tick_ptr = midi_lib.midi_get_tick_count_ptr()
+        # one syscall per status line, no io-lock/buffer management like print
+        write = os.write
+        while running or log_q:
+            try:
+                beat, tick = log_q.popleft()
+            except IndexError:
+                time.sleep(0.05)
+                continue
+            write(1, f"[Python] Beat {beat:4d} | MIDI Tick {tick:6d} | Queue Tick {tick_ptr[0]:6d}\n".encode())
+
+    log_thread = threading.Thread(target=log_worker, daemon=True)
+    log_thread.start()
+
+    # Bind hot-loop names to locals to avoid per-iteration attribute/global
+    # lookups (LOAD_ATTR/LOAD_GLOBAL bytecodes) in the tick path
+    schedule_clock = midi_lib.midi_schedule_clock
+    log_append = log_q.append
+    timerfd_setup = midi_lib.midi_timerfd_setup
+    timerfd_wait = midi_lib.midi_timerfd_wait
+    clock_gettime_ns = time.clock_gettime_ns
+    CLOCK_MONOTONIC = time.CLOCK_MONOTONIC
+    ppqn = PPQN
+    ticks_per_batch = TICKS_PER_BATCH
+
+    # Pacing comes from a periodic kernel timer (timerfd on the monotonic
+    # clock): one expiration = one batch period, and the kernel reports how
+    # many periods elapsed since the last wait, so falling behind is caught
+    # up losslessly instead of being resynced away
+    batch_interval_ns = tick_interval_ns * ticks_per_batch
+    now_ns = clock_gettime_ns(CLOCK_MONOTONIC)
+    seq_index = 0
+    next_change_ns = None  # when to apply next scripted BPM change
+    if bpm_sequence:
+        change_interval_ns = int(change_interval_s * 1e9)
+        next_change_ns = now_ns + change_interval_ns
+        # The scripted tempo set is known up front, so the batch period for
+        # each BPM is computed once here instead of on every change
+        batch_intervals_ns = {bpm: calculate_tick_interval_ns(bpm) * ticks_per_batch
+                              for bpm in (current_bpm, *bpm_sequence)}
+    if timerfd_setup(batch_interval_ns, now_ns + batch_interval_ns) < 0:
+        print("[Python] Error: Failed to set up pacing timer")
+        return -1, -1
+
+    # Prime the queue with the first batch so the timer period is covered
+    if schedule_clock(ticks_per_batch) < 0:
+        print("[Python] Error: Failed to schedule MIDI CLOCK batch")
+        return -1, -1
+    tick_count = ticks_per_batch
+    beat_count = 0
+    # Countdown to the next beat boundary; cheaper per iteration than the
+    # divmod on tick_count (no division, no fresh PyLong unless a beat passed)
+    ticks_until_beat = ppqn - tick_count
+
+    # Main loop - send MIDI clock ticks
+    try:
+        while running:
+            # Check for scripted tempo change events
+            if next_change_ns is not None:
+                now_ns = clock_gettime_ns(CLOCK_MONOTONIC)
+                if now_ns >= next_change_ns:
+                    new_bpm = bpm_sequence[seq_index]
+                    change_tempo(new_bpm)
+                    new_batch_ns = batch_intervals_ns[new_bpm]
+                    if new_batch_ns != batch_interval_ns:
+                        batch_interval_ns = new_batch_ns
+                        # Re-arm the timer with the new batch period
+                        timerfd_setup(batch_interval_ns, now_ns + batch_interval_ns)
+                    seq_index = (seq_index + 1) % len(bpm_sequence)
+                    next_change_ns += change_interval_ns
+
+            # Block until the next batch period; expirations > 1 means we
+            # fell behind and the missed batches are enqueued in one burst
+            # (the queue emits overdue events immediately, keeping receivers
+            # in tick sync)
+            expirations = timerfd_wait()
+            if expirations == 0:
+                # interrupted (e.g. SIGINT) - loop re-checks running
+                continue
+
+            added = expirations * ticks_per_batch
+            if schedule_clock(added) < 0:
+                print("[Python] Error: Failed to schedule MIDI CLOCK batch")
+                break
+
+            tick_count += added
+
+            # Queue status for the logger thread every quarter note (24 ticks = 1 beat)
+            ticks_until_beat -= added
+            if ticks_until_beat <= 0:
+                beats_crossed = 1 + (-ticks_until_beat) // ppqn
+                beat_count += beats_crossed
+                ticks_until_beat += beats_crossed * ppqn
+                log_append((beat_count, tick_count))
+
+    except Exception as e:
+        print(f"[Python] Error in main loop: {e}")
+
+    # Let the logger drain, then stop it
+    running = False
+    log_thread.join(timeout=1.0)
+    return tick_count, beat_count
+
+
+def run(initial_bpm, bpm_sequence=None, change_interval_s=None,
+        pace_in_python=False, monitor=None):
+    """Initialize the MIDI clock and run it until SIGINT/SIGTERM.
+
+    bpm_sequence / change_interval_s: optional scripted tempo changes that
+    cycle through the sequence every change_interval_s seconds.
+    pace_in_python: top up the ALSA queue from the Python timerfd loop
+    instead of running the C tick thread (the debug harness path).
+    monitor: optional callable started on a daemon thread once the clock is
+    running (clock.py uses it for the Link tempo listener).
+
+    Returns a process exit code.
+    """
+    global running, midi_lib, tempo_ptr, tick_interval_ns, current_bpm, _pace_in_python
+
+    running = True
+    current_bpm = float(initial_bpm)
+    _pace_in_python = pace_in_python
+
+    # Setup signal handler
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+
+    # Load the C library (no exists-probe; a failed dlopen raises OSError)
+    lib_path = os.path.join(os.path.dirname(__file__), 'liblinkbridge.so')
+
+    try:
+        midi_lib = load_midi_lib(lib_path)
+    except OSError as e:
+        print(f"Error loading library: {e}")
+        print("If it is missing, compile it first:")
+        print("  gcc -shared -fPIC -pthread -o liblinkbridge.so midi_clock_lib.c -lasound")
+        return 1
+
+    print("[Python] Python MIDI Clock Generator")
+    print("[Python] ============================")
+    print(f"[Python] BPM: {current_bpm:.1f}, PPQN: {PPQN}")
+    print()
+
+    # Initialize MIDI
+    print("[Python] Initializing ALSA MIDI...")
+    if midi_lib.midi_init() < 0:
+        print("[Python] Error: Failed to initialize MIDI")
+        return 1
+
+    # Request real-time scheduling and lock memory; threads started later
+    # inherit the policy. Non-fatal if refused (needs CAP_SYS_NICE, see README)
+    if midi_lib.midi_enable_realtime(RT_PRIORITY) < 0:
+        print("[Python] Warning: real-time scheduling not available, continuing at normal priority")
+
+    # Optionally pin to a dedicated core; later threads inherit the mask
+    if PIN_CPU >= 0 and midi_lib.midi_pin_cpu(PIN_CPU) < 0:
+        print(f"[Python] Warning: could not pin to CPU {PIN_CPU}")
+
+    # Set tempo in the C queue to match the initial BPM (send tenths as int)
+    if midi_lib.midi_set_tempo(int(round(current_bpm * 10.0))) < 0:
+        print(f"[Python] Warning: Failed to set tempo to {current_bpm:.1f} BPM in C library")
+    # initialize tick interval from current_bpm
+    tick_interval_ns = calculate_tick_interval_ns(current_bpm)
+    # grab the pointer to the C tempo word; change_tempo writes through it
+    tempo_ptr = midi_lib.midi_tempo_ptr()
+
+    client_id = midi_lib.midi_get_client_id()
+    port_id = midi_lib.midi_get_port_id()
+    queue_id = midi_lib.midi_get_queue_id()
+
+    print(f"[Python] ALSA Client ID: {client_id}")
+    print(f"[Python] ALSA Port ID: {port_id}")
+    print(f"[Python] ALSA Queue ID: {queue_id}")
+    print(f"[Python] Connect with: aconnect {client_id}:{port_id} <destination>")
+    print()
+    print("[Python] Press Ctrl+C to stop")
+    print()
+
+    # Send MIDI Start
+    if midi_lib.midi_send_start() < 0:
+        print("[Python] Error: Failed to send MIDI START")
+        midi_lib.midi_cleanup()
+        return 1
+
+    # Start the optional monitor (e.g. the Link tempo listener)
+    if monitor is not None:
+        monitor_thread = threading.Thread(target=monitor, daemon=True)
+        monitor_thread.start()
+
+    print(f"[Python] Tick interval: {tick_interval_ns/1e6:.3f} ms ({1e9/tick_interval_ns:.1f} ticks/sec)")
+    print()
+
+    # Keep the cyclic GC out of the real-time section: collect the startup
+    # garbage once, freeze the survivors so they are never rescanned, then
+    # disable collection entirely - a multi-ms GC pause inside the loop is
+    # enough to miss a tick deadline
+    saved_thresholds = gc.get_threshold()
+    gc.collect()
+    gc.freeze()
+    gc.set_threshold(0)
+    gc.disable()
+
+    try:
+        if pace_in_python:
+            tick_count, beat_count = _run_python_loop(bpm_sequence, change_interval_s)
+        else:
+            tick_count, beat_count = _run_c_loop(bpm_sequence, change_interval_s)
+    finally:
+        gc.enable()
+        gc.set_threshold(*saved_thresholds)
+        gc.unfreeze()
+
+    # Cleanup
+    print()
+    print("[Python] Stopping MIDI clock...")
+
+    # Send MIDI Stop
+    midi_lib.midi_send_stop()
+
+    # Small delay to let the stop message be delivered
+    time.sleep(0.1)
+
+    # Cleanup ALSA resources
+    midi_lib.midi_cleanup()
+
+    if tick_count < 0:
+        print("[Python] Shutdown after error")
+        return 1
+
+    print(f"[Python] Total ticks sent: {tick_count}")
+    print(f"[Python] Total beats: {beat_count}")
+    print("[Python] Shutdown complete")
+
+    return 0
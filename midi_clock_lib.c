@@ -1,19 +1,43 @@
+#define _GNU_SOURCE  /* pthread_setaffinity_np, CPU_SET */
+
 #include <stdio.h>
 #include <stdlib.h>
+#include <stdint.h>
+#include <stdatomic.h>
+#include <pthread.h>
+#include <string.h>
+#include <errno.h>
+#include <time.h>
+#include <sched.h>
+#include <sys/mman.h>
+#include <sys/timerfd.h>
+#include <unistd.h>
 #include <alsa/asoundlib.h>
 
 #define BPM 120
 #define PPQN 24
 #define QUEUE_TEMPO_PPQ 96
+/* clocks enqueued per drain by midi_run_clock (~250 ms at 120 BPM) */
+#define TICKS_PER_BATCH (PPQN / 2)
 
 // Global handles
 static snd_seq_t *seq_handle = NULL;
 static int port_id = -1;
 static int queue_id = -1;
-static snd_seq_tick_time_t current_queue_tick = 0;
+static volatile snd_seq_tick_time_t current_queue_tick = 0;
 /* highest tick we've scheduled so far (used to place tempo changes after all
     previously queued events) */
 static snd_seq_tick_time_t max_scheduled_tick = 0;
+/* current tempo in tenths of BPM; midi_run_clock() re-reads this between
+    ticks, so it can be updated lock-free from any thread - either through
+    midi_set_tempo() or by writing through midi_tempo_ptr() directly */
+static _Atomic int g_bpm10 = BPM * 10;
+/* periodic timer used by midi_timerfd_wait() for batch pacing */
+static int timer_fd = -1;
+/* data-plane thread state for midi_start_generator()/midi_stop_generator() */
+static pthread_t generator_thread;
+static volatile int generator_stop = 0;
+static int generator_running = 0;
 
 // Initialize ALSA sequencer, create port and queue
 // Returns 0 on success, -1 on error
@@ -77,16 +101,9 @@ int midi_init(void) {
 // Returns 0 on success, -1 on error
 // Update the queue tempo using BPM value expressed in tenths (e.g. 1200 = 120.0 BPM)
 // Returns 0 on success, -1 on error
-int midi_set_tempo(int bpm10) {
-    if (seq_handle == NULL) {
-        fprintf(stderr, "Error: MIDI not initialized\n");
-        return -1;
-    }
-    if (bpm10 <= 0) {
-        fprintf(stderr, "Error: invalid BPM (tenths) %d\n", bpm10);
-        return -1;
-    }
-
+// Enqueue a queue-tempo change for bpm10 (tenths of BPM)
+// Returns 0 on success, -1 on error
+static int apply_queue_tempo(int bpm10) {
     /* bpm10 is BPM * 10. To compute microseconds per beat:
      * us_per_beat = 60000000 / BPM = 60000000 / (bpm10 / 10) = 600000000 / bpm10
      */
@@ -126,6 +143,30 @@ int midi_set_tempo(int bpm10) {
     return 0;
 }
 
+int midi_set_tempo(int bpm10) {
+    if (seq_handle == NULL) {
+        fprintf(stderr, "Error: MIDI not initialized\n");
+        return -1;
+    }
+    if (bpm10 <= 0) {
+        fprintf(stderr, "Error: invalid BPM (tenths) %d\n", bpm10);
+        return -1;
+    }
+
+    if (apply_queue_tempo(bpm10) < 0)
+        return -1;
+
+    g_bpm10 = bpm10;
+    return 0;
+}
+
+// Expose the tempo word so Python can change tempo lock-free with a plain
+// atomic store (no FFI call); midi_run_clock() notices the new value on its
+// next tick and applies the queue-tempo change itself
+int *midi_tempo_ptr(void) {
+    return (int *)&g_bpm10;
+}
+
 // Send MIDI Start message
 // Returns 0 on success, -1 on error
 int midi_send_start(void) {
@@ -155,28 +196,308 @@ int midi_send_start(void) {
     return 0;
 }
 
-// Send MIDI Clock message
+// Enqueue one CLOCK event at the current queue tick (no drain)
 // Returns 0 on success, -1 on error
-int midi_send_clock(void) {
-    if (seq_handle == NULL) {
-        fprintf(stderr, "Error: MIDI not initialized\n");
-        return -1;
-    }
-    
+static int enqueue_clock_event(void) {
     snd_seq_event_t ev;
     snd_seq_ev_clear(&ev);
     snd_seq_ev_set_source(&ev, port_id);
     snd_seq_ev_set_subs(&ev);
     ev.type = SND_SEQ_EVENT_CLOCK;
-    
+
     snd_seq_ev_schedule_tick(&ev, queue_id, 0, current_queue_tick);
-    snd_seq_event_output(seq_handle, &ev);
-    snd_seq_drain_output(seq_handle);
-    
+    int err = snd_seq_event_output(seq_handle, &ev);
+    if (err < 0) {
+        fprintf(stderr, "Error enqueuing clock event: %s\n", snd_strerror(err));
+        return -1;
+    }
+
     // Advance queue tick by ratio (96 PPQ / 24 PPQN = 4 ticks per MIDI clock)
     current_queue_tick += (QUEUE_TEMPO_PPQ / PPQN);
     if (current_queue_tick > max_scheduled_tick) max_scheduled_tick = current_queue_tick;
-    
+
+    return 0;
+}
+
+// Send MIDI Clock message
+// Returns 0 on success, -1 on error
+int midi_send_clock(void) {
+    if (seq_handle == NULL) {
+        fprintf(stderr, "Error: MIDI not initialized\n");
+        return -1;
+    }
+
+    if (enqueue_clock_event() < 0)
+        return -1;
+    snd_seq_drain_output(seq_handle);
+
+    return 0;
+}
+
+// Pre-enqueue n CLOCK events at their scheduled queue ticks with a single
+// drain. The queue emits them at the right times, so the caller only has to
+// top up the queue ahead of real time instead of pacing every tick.
+// Returns 0 on success, -1 on error
+int midi_schedule_clock(unsigned int n) {
+    if (seq_handle == NULL) {
+        fprintf(stderr, "Error: MIDI not initialized\n");
+        return -1;
+    }
+
+    for (unsigned int i = 0; i < n; i++) {
+        if (enqueue_clock_event() < 0)
+            return -1;
+    }
+    snd_seq_drain_output(seq_handle);
+
+    return 0;
+}
+
+// Drain any events still sitting in the client output buffer. Lets callers
+// that enqueue without draining coalesce many events into one ioctl.
+// Returns 0 on success, -1 on error
+int midi_flush(void) {
+    if (seq_handle == NULL) {
+        fprintf(stderr, "Error: MIDI not initialized\n");
+        return -1;
+    }
+
+    int err = snd_seq_drain_output(seq_handle);
+    if (err < 0) {
+        fprintf(stderr, "Error draining output: %s\n", snd_strerror(err));
+        return -1;
+    }
+    return 0;
+}
+
+// Elevate the calling thread to SCHED_FIFO real-time priority and lock all
+// current and future pages in RAM so the tick path cannot be paged out.
+// Threads created afterwards inherit the policy, so calling this before
+// starting the clock thread covers it too. Needs CAP_SYS_NICE or an
+// RLIMIT_RTPRIO grant (see README); callers treat failure as non-fatal.
+// Returns 0 on success, -1 on error
+int midi_enable_realtime(int prio) {
+    struct sched_param p;
+    memset(&p, 0, sizeof(p));
+    p.sched_priority = prio;
+
+    if (sched_setscheduler(0, SCHED_FIFO, &p) < 0) {
+        fprintf(stderr, "Warning: failed to set SCHED_FIFO priority %d: %s\n",
+                prio, strerror(errno));
+        return -1;
+    }
+
+    if (mlockall(MCL_CURRENT | MCL_FUTURE) < 0) {
+        fprintf(stderr, "Warning: mlockall failed: %s\n", strerror(errno));
+    }
+
+    printf("[C] Real-time scheduling enabled (SCHED_FIFO priority %d)\n", prio);
+
+    return 0;
+}
+
+// Pin the calling thread to a single CPU. Threads created afterwards
+// inherit the mask, so pinning before the clock thread starts keeps the
+// tick path off cores where the scheduler migrates other work (cold-cache
+// migrations and DVFS wake-up latency both show up as clock jitter). Best
+// combined with isolcpus= and the performance governor for that core (see
+// README); callers treat failure as non-fatal.
+// Returns 0 on success, -1 on error
+int midi_pin_cpu(int cpu) {
+    cpu_set_t set;
+    CPU_ZERO(&set);
+    CPU_SET(cpu, &set);
+
+    int err = pthread_setaffinity_np(pthread_self(), sizeof(set), &set);
+    if (err != 0) {
+        fprintf(stderr, "Warning: failed to pin to CPU %d: %s\n",
+                cpu, strerror(err));
+        return -1;
+    }
+
+    printf("[C] Pinned to CPU %d\n", cpu);
+
+    return 0;
+}
+
+// Sleep until an absolute CLOCK_MONOTONIC time given in nanoseconds.
+// With TIMER_ABSTIME the kernel computes the remaining time itself, so the
+// gap between reading the clock in userspace and entering the syscall does
+// not add to jitter. Returns immediately if the deadline already passed.
+// Returns 0 on success, -1 on error
+int midi_sleep_until_monotonic_ns(uint64_t deadline_ns) {
+    struct timespec ts;
+    ts.tv_sec = deadline_ns / 1000000000ULL;
+    ts.tv_nsec = deadline_ns % 1000000000ULL;
+
+    int err;
+    while ((err = clock_nanosleep(CLOCK_MONOTONIC, TIMER_ABSTIME, &ts, NULL)) == EINTR)
+        ;
+    if (err != 0) {
+        fprintf(stderr, "Error in clock_nanosleep: %s\n", strerror(err));
+        return -1;
+    }
+    return 0;
+}
+
+// Arm (or re-arm, e.g. after a tempo change) a periodic CLOCK_MONOTONIC
+// timerfd with the given interval, first firing at the given absolute time
+// in nanoseconds. Pair with midi_timerfd_wait().
+// Returns 0 on success, -1 on error
+int midi_timerfd_setup(uint64_t interval_ns, uint64_t first_deadline_ns) {
+    if (timer_fd < 0) {
+        timer_fd = timerfd_create(CLOCK_MONOTONIC, 0);
+        if (timer_fd < 0) {
+            fprintf(stderr, "Error creating timerfd: %s\n", strerror(errno));
+            return -1;
+        }
+    }
+
+    struct itimerspec its;
+    its.it_interval.tv_sec = interval_ns / 1000000000ULL;
+    its.it_interval.tv_nsec = interval_ns % 1000000000ULL;
+    its.it_value.tv_sec = first_deadline_ns / 1000000000ULL;
+    its.it_value.tv_nsec = first_deadline_ns % 1000000000ULL;
+
+    if (timerfd_settime(timer_fd, TFD_TIMER_ABSTIME, &its, NULL) < 0) {
+        fprintf(stderr, "Error arming timerfd: %s\n", strerror(errno));
+        return -1;
+    }
+
+    return 0;
+}
+
+// Block until the timer armed by midi_timerfd_setup() expires. The kernel
+// counts expirations, so a return value greater than 1 tells the caller
+// exactly how many periods were missed - no lossy resync needed.
+// Returns the expiration count, or 0 if interrupted (e.g. by SIGINT) or on
+// error
+uint64_t midi_timerfd_wait(void) {
+    if (timer_fd < 0) {
+        fprintf(stderr, "Error: timerfd not set up\n");
+        return 0;
+    }
+
+    uint64_t expirations = 0;
+    ssize_t r = read(timer_fd, &expirations, sizeof(expirations));
+    if (r != (ssize_t)sizeof(expirations))
+        return 0;
+    return expirations;
+}
+
+// Run the tick-pacing loop in C until *stop_flag becomes non-zero.
+// Each iteration pre-enqueues a batch of scheduled CLOCK events with a
+// single drain (one ioctl per batch instead of per tick; the queue emits
+// them at their tick times) and then sleeps one batch period with
+// clock_nanosleep on the monotonic clock, using absolute deadlines to
+// prevent drift. Tempo changes made via midi_set_tempo() or through
+// midi_tempo_ptr() are picked up between batches. Intended to be run on a
+// worker thread so Python only acts as the tempo-change controller.
+// Returns the number of ticks sent, or -1 on error
+int midi_run_clock(volatile int *stop_flag) {
+    if (seq_handle == NULL) {
+        fprintf(stderr, "Error: MIDI not initialized\n");
+        return -1;
+    }
+
+    int bpm10 = g_bpm10;
+    uint64_t interval_ns = 600000000000ULL / ((uint64_t)bpm10 * PPQN);
+    uint64_t batch_ns = interval_ns * TICKS_PER_BATCH;
+    int ticks_sent = 0;
+
+    struct timespec deadline;
+    clock_gettime(CLOCK_MONOTONIC, &deadline);
+
+    while (!*stop_flag) {
+        if (midi_schedule_clock(TICKS_PER_BATCH) < 0)
+            return -1;
+        ticks_sent += TICKS_PER_BATCH;
+
+        // Pick up tempo changes between batches. Writes through
+        // midi_tempo_ptr() only touch the atomic, so the queue-tempo
+        // change is applied here on the emitting thread
+        int new_bpm10 = g_bpm10;
+        if (new_bpm10 != bpm10 && new_bpm10 > 0) {
+            bpm10 = new_bpm10;
+            interval_ns = 600000000000ULL / ((uint64_t)bpm10 * PPQN);
+            batch_ns = interval_ns * TICKS_PER_BATCH;
+            apply_queue_tempo(bpm10);
+        }
+
+        // Advance the absolute deadline by one batch period
+        deadline.tv_sec += batch_ns / 1000000000ULL;
+        deadline.tv_nsec += batch_ns % 1000000000ULL;
+        if (deadline.tv_nsec >= 1000000000L) {
+            deadline.tv_sec++;
+            deadline.tv_nsec -= 1000000000L;
+        }
+
+        clock_nanosleep(CLOCK_MONOTONIC, TIMER_ABSTIME, &deadline, NULL);
+
+        // If we have fallen more than one batch period behind, resync to now
+        struct timespec now;
+        clock_gettime(CLOCK_MONOTONIC, &now);
+        int64_t behind_ns = (int64_t)(now.tv_sec - deadline.tv_sec) * 1000000000LL
+                            + (int64_t)(now.tv_nsec - deadline.tv_nsec);
+        if (behind_ns > (int64_t)batch_ns)
+            deadline = now;
+    }
+
+    return ticks_sent;
+}
+
+static void *generator_main(void *arg) {
+    (void)arg;
+    midi_run_clock(&generator_stop);
+    return NULL;
+}
+
+// Spawn the clock generator on a C-owned pthread: the library becomes the
+// data plane (queue-scheduled batches, paced by clock_nanosleep, inheriting
+// whatever SCHED_FIFO/affinity setup the caller made) and the caller is left
+// as a pure control plane - tempo via midi_set_tempo()/midi_tempo_ptr(),
+// lifetime via midi_stop_generator().
+// Returns 0 on success, -1 on error
+int midi_start_generator(void) {
+    if (seq_handle == NULL) {
+        fprintf(stderr, "Error: MIDI not initialized\n");
+        return -1;
+    }
+    if (generator_running) {
+        fprintf(stderr, "Error: generator already running\n");
+        return -1;
+    }
+
+    generator_stop = 0;
+    int err = pthread_create(&generator_thread, NULL, generator_main, NULL);
+    if (err != 0) {
+        fprintf(stderr, "Error starting generator thread: %s\n", strerror(err));
+        return -1;
+    }
+    generator_running = 1;
+
+    printf("[C] Clock generator thread started\n");
+
+    return 0;
+}
+
+// Stop the generator thread and wait for it to finish its current batch.
+// Safe to call when it is not running.
+// Returns 0 on success, -1 on error
+int midi_stop_generator(void) {
+    if (!generator_running)
+        return 0;
+
+    generator_stop = 1;
+    int err = pthread_join(generator_thread, NULL);
+    generator_running = 0;
+    if (err != 0) {
+        fprintf(stderr, "Error joining generator thread: %s\n", strerror(err));
+        return -1;
+    }
+
+    printf("[C] Clock generator thread stopped\n");
+
     return 0;
 }
 
@@ -208,8 +529,19 @@ unsigned int midi_get_tick_count(void) {
     return current_queue_tick;
 }
 
+// Expose the queue tick counter so status pollers can read it with a plain
+// memory load instead of an FFI call per poll
+unsigned int *midi_get_tick_count_ptr(void) {
+    return (unsigned int *)&current_queue_tick;
+}
+
 // Cleanup and close ALSA sequencer
 void midi_cleanup(void) {
+    midi_stop_generator();
+    if (timer_fd >= 0) {
+        close(timer_fd);
+        timer_fd = -1;
+    }
     if (seq_handle != NULL) {
         if (queue_id >= 0) {
             snd_seq_stop_queue(seq_handle, queue_id, NULL);